@@ -7,10 +7,12 @@ It provides the following:
     2. Integrate results into an ATAP Corpus.
 """
 
+import copy
 import os
 import sys
 import subprocess
 import tempfile
+import threading
 from enum import Enum
 from os import PathLike
 from typing import IO, Callable, Any
@@ -19,6 +21,7 @@ from IPython.display import HTML
 
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
 
 from atap_corpus import Corpus
 from atap_corpus.parts.dtm import DTM
@@ -30,12 +33,17 @@ import srsly
 __all__ = [
     "add_results",
     "visualise",
+    "fit_tiered",
+    "TieredFit",
 ]
 
 _SEED: int | None = None
 
 
-def add_results(model: sbmtm, corpus: Corpus):
+def add_results(model: "sbmtm | TieredFit", corpus: Corpus):
+    tiered: dict | None = None
+    if isinstance(model, TieredFit):
+        model, tiered = model.snapshot()
     if not isinstance(model, sbmtm):
         raise ValueError(f"Expecting sbmtm for model but got {model}.")
     if not isinstance(corpus, Corpus):
@@ -71,6 +79,8 @@ def add_results(model: sbmtm, corpus: Corpus):
         )
     if _SEED is not None:
         attribs["seed"] = _SEED
+    if tiered is not None:
+        attribs["tiered"] = tiered
     corpus.attribute("topsbm", attribs)
 
 
@@ -179,7 +189,7 @@ MAX_LEAF_DOCS: int = 30
 
 
 def visualise(
-    model: sbmtm,
+    model: "sbmtm | TieredFit",
     corpus: Corpus,
     kind: str | GroupMembershipKind,
     width: int,
@@ -205,6 +215,7 @@ def visualise(
         raise ValueError(
             f"{kind} is not valid. Either {', '.join([k.value for k in GroupMembershipKind])}"
         )
+    model = _resolve_model(model)
     digraph: nx.DiGraph
     match kind:
         case GroupMembershipKind.DOCUMENTS:
@@ -437,3 +448,344 @@ def set_seed(seed: int = 42):
     global _SEED
     gt.seed_rng(seed)
     _SEED = seed
+
+
+# -- Tiered fitting --
+PROVISIONAL_MAX_WORDS: int = 2000
+PROVISIONAL_MAX_DOC_WORDS: int = 20
+PROVISIONAL_SWEEPS: int = 50
+REFINE_MAX_SWEEPS: int = 100
+
+
+class TieredFit(object):
+    """A provisional fit on a pruned graph that is refined in the background.
+
+    Pass this to visualise() or add_results() in place of a fitted sbmtm.
+    The provisional model is used until refinement finishes, after which the
+    refined model is swapped in.
+    """
+
+    def __init__(self, source: sbmtm, provisional: sbmtm):
+        self.source = source
+        self.provisional = provisional
+        self.refined: sbmtm | None = None
+        self.warm_start_mdl: float | None = None
+        self.error: Exception | None = None
+        self.callback_error: Exception | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def model(self) -> sbmtm:
+        return self.snapshot()[0]
+
+    @property
+    def is_refined(self) -> bool:
+        return self.refined is not None
+
+    def wait(self, timeout: float | None = None) -> sbmtm:
+        """Blocks until refinement finishes (or timeout) and returns the current model.
+
+        Once refined, the source model is also updated with the refined results.
+        Raises the refinement error if refinement failed.
+        Errors from the on_refined callback are kept in callback_error and not raised.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        refined = self.refined
+        if refined is not None and self.source.state is not refined.state:
+            self.source.state = refined.state
+            self.source.mdl = refined.mdl
+            self.source.L = refined.L
+            if hasattr(self.source, "groups"):
+                self.source.groups = {}
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+    def snapshot(self) -> tuple[sbmtm, dict[str, str | float | None]]:
+        """Returns the current model together with its status and description lengths.
+
+        provisional and refined are description lengths on the full graph.
+        The provisional one is that of the warm start, i.e. the provisional
+        partition lifted onto the full graph, so the two are comparable.
+        gap = provisional - refined.
+        provisional_pruned is the provisional fit's own description length on the
+        pruned graph, which is not comparable with the others.
+        """
+        refined = self.refined
+        provisional_mdl = self.warm_start_mdl
+        refined_mdl = float(refined.mdl) if refined is not None else None
+        gap = None
+        if provisional_mdl is not None and refined_mdl is not None:
+            gap = provisional_mdl - refined_mdl
+        info = {
+            "status": "refined" if refined is not None else "provisional",
+            "provisional": provisional_mdl,
+            "refined": refined_mdl,
+            "gap": gap,
+            "provisional_pruned": float(self.provisional.mdl),
+        }
+        return (refined if refined is not None else self.provisional), info
+
+    def description_lengths(self) -> dict[str, float | None]:
+        _, info = self.snapshot()
+        return {k: v for k, v in info.items() if k != "status"}
+
+    def __repr__(self) -> str:
+        _, info = self.snapshot()
+        return (
+            f"<TieredFit status={info['status']} provisional_mdl={info['provisional']} "
+            f"refined_mdl={info['refined']} gap={info['gap']}>"
+        )
+
+
+def fit_tiered(
+    model: sbmtm,
+    max_words: int = PROVISIONAL_MAX_WORDS,
+    max_doc_words: int = PROVISIONAL_MAX_DOC_WORDS,
+    provisional_sweeps: int = PROVISIONAL_SWEEPS,
+    max_sweeps: int = REFINE_MAX_SWEEPS,
+    epsilon: float = 1e-3,
+    background: bool = True,
+    on_refined: Callable[[TieredFit], Any] | None = None,
+) -> TieredFit:
+    """Fit TopSBM in two tiers for interactive exploration.
+    :arg model - an sbmtm where .make_graph() has been called.
+    :arg max_words - the number of most frequent words kept for the provisional fit.
+    :arg max_doc_words - the number of edges (distinct words) kept per document for the provisional fit.
+    :arg provisional_sweeps - the exact number of merge-split sweeps of the provisional fit.
+    :arg max_sweeps - the maximum number of merge-split sweeps of the refinement.
+    :arg epsilon - refinement stops early once a sweep improves the description length by less than this.
+    :arg background - refine in a background thread, otherwise block until refined.
+    :arg on_refined - called with the TieredFit once the refined model is swapped in.
+
+    :return TieredFit with the provisional model available immediately.
+
+    1. The provisional graph keeps all documents but only the top max_words words,
+    and at most max_doc_words of those per document, so it has at most
+    (#documents x max_doc_words) edges. Each document also keeps its most
+    frequent word so that no document is left without edges.
+    The provisional fit starts from a single group per kind and runs
+    provisional_sweeps sweeps, with no convergence loop.
+    2. Refinement warm starts from the provisional partition on the full graph.
+    Pruned words are assigned to the word group they co-occur with the most.
+    The refined model is a separate sbmtm; the provided model is only updated by
+    TieredFit.wait().
+    """
+    if not isinstance(model, sbmtm):
+        raise ValueError(f"Expecting sbmtm for model but got {model}.")
+    if model.g is None:
+        raise ValueError(
+            "Your model has no graph yet. Call .make_graph() on the model."
+        )
+    if "count" not in model.g.ep:
+        raise ValueError("Tiered fitting requires a graph built with counts=True.")
+    if max_words < 1:
+        raise ValueError("max_words must be at least 1.")
+    if max_doc_words < 1:
+        raise ValueError("max_doc_words must be at least 1.")
+    if provisional_sweeps < 1:
+        raise ValueError("provisional_sweeps must be at least 1.")
+
+    g = model.g
+    kind = g.vp["kind"].a
+    eidx, docs, words, counts = _edges_of(g)
+    keep, keep_edges = _provisional_mask(
+        kind, docs, words, counts, max_words=max_words, max_doc_words=max_doc_words
+    )
+    provisional = _provisional_model(
+        model, keep=keep, keep_edges=eidx[keep_edges], sweeps=provisional_sweeps
+    )
+
+    fit = TieredFit(model, provisional)
+    bs = _lift_bs(kind, docs, words, counts, keep, provisional.state.get_bs())
+    state = _nested_state(g, bs)
+    fit.warm_start_mdl = float(state.entropy())
+
+    def refine():
+        try:
+            _refine(fit, state, max_sweeps=max_sweeps, epsilon=epsilon)
+        except Exception as e:
+            fit.error = e
+            if background:
+                print(f"TopSBM refinement failed: {e}", file=sys.stderr)
+            return
+        if on_refined is not None:
+            try:
+                on_refined(fit)
+            except Exception as e:
+                fit.callback_error = e
+                print(f"on_refined callback failed: {e}", file=sys.stderr)
+
+    if background:
+        fit._thread = threading.Thread(target=refine, daemon=True)
+        fit._thread.start()
+    else:
+        refine()
+        fit.wait()
+    return fit
+
+
+def _resolve_model(model: "sbmtm | TieredFit") -> sbmtm:
+    if isinstance(model, TieredFit):
+        return model.model
+    return model
+
+
+def _nested_state(g, bs: list[np.ndarray]):
+    """NestedBlockState with the same state arguments as sbmtm.fit() for a graph built with counts=True."""
+    import graph_tool.all as gt
+
+    clabel = g.vp["kind"]
+    return gt.NestedBlockState(
+        g,
+        bs=bs,
+        base_type=gt.BlockState,
+        clabel=clabel,
+        pclabel=clabel,
+        eweight=g.ep["count"],
+    )
+
+
+def _fitted_model(template: sbmtm, g, words: list[str], state) -> sbmtm:
+    """Returns a shallow copy of template with the graph and state replaced.
+
+    The hierarchy is trimmed and mdl and L are set the same way as sbmtm.fit().
+    """
+    L = 0
+    for s in state.levels:
+        L += 1
+        if s.get_nonempty_B() == 2:
+            break
+    state = state.copy(bs=state.get_bs()[:L] + [np.zeros(1)])
+
+    fitted = copy.copy(template)
+    fitted.g = g
+    fitted.words = words
+    fitted.state = state
+    fitted.mdl = state.entropy()
+    L = len(state.levels)
+    fitted.L = 1 if L == 2 else L - 2
+    if hasattr(fitted, "groups"):
+        fitted.groups = {}
+    return fitted
+
+
+def _edges_of(g) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Returns (edge index, document vertex, word vertex, count) for every edge of the graph."""
+    edges = g.get_edges([g.edge_index, g.ep["count"]])
+    src, tgt, eidx = edges[:, :3].astype(np.int64).T
+    is_word_src = g.vp["kind"].a[src] == 1
+    docs = np.where(is_word_src, tgt, src)
+    words = np.where(is_word_src, src, tgt)
+    return eidx, docs, words, edges[:, 3]
+
+
+def _provisional_mask(
+    kind: np.ndarray,
+    docs: np.ndarray,
+    words: np.ndarray,
+    counts: np.ndarray,
+    max_words: int,
+    max_doc_words: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns boolean masks over the vertices and over the edges of the provisional graph.
+
+    Each document keeps up to max_doc_words edges to the top max_words words by
+    count, and always at least its most frequent word.
+    Words without a kept edge are dropped.
+    """
+    n = len(kind)
+    freqs = np.bincount(words, weights=counts, minlength=n)
+    word_vertices = np.flatnonzero(kind == 1)
+    top_words = word_vertices[np.argsort(freqs[word_vertices])[::-1][:max_words]]
+    is_top = np.zeros(n, dtype=bool)
+    is_top[top_words] = True
+
+    # edges sorted by document, then top words first, then by descending count.
+    order = np.lexsort((-counts, ~is_top[words], docs))
+    sorted_docs = docs[order]
+    _, first, num_edges = np.unique(sorted_docs, return_index=True, return_counts=True)
+    rank = np.arange(len(order)) - np.repeat(first, num_edges)
+
+    keep_edges = np.zeros(len(docs), dtype=bool)
+    keep_edges[order] = ((rank < max_doc_words) & is_top[words[order]]) | (rank == 0)
+
+    keep = kind == 0
+    keep[words[keep_edges]] = True
+    return keep, keep_edges
+
+
+def _provisional_model(
+    model: sbmtm, keep: np.ndarray, keep_edges: np.ndarray, sweeps: int
+) -> sbmtm:
+    import graph_tool.all as gt
+
+    g = model.g
+    vfilt = g.new_vertex_property("bool")
+    vfilt.a = keep
+    efilt = g.new_edge_property("bool")
+    efilt.a[keep_edges] = True
+    pruned = gt.Graph(gt.GraphView(g, vfilt=vfilt, efilt=efilt), prune=True)
+
+    # a single group per kind (documents, words) over a hierarchy deep enough to
+    # be filled in by the merge-split sweeps.
+    n = pruned.num_vertices()
+    depth = max(2, int(np.ceil(np.log2(n))))
+    bs = [pruned.vp["kind"].a.astype(np.int64)] + [np.arange(2)] * (depth - 1)
+    state = _nested_state(pruned, bs)
+    for _ in range(sweeps):
+        state.multiflip_mcmc_sweep(beta=np.inf, niter=1)
+
+    words = [
+        pruned.vp["name"][v] for v in pruned.vertices() if pruned.vp["kind"][v] == 1
+    ]
+    return _fitted_model(model, pruned, words, state)
+
+
+def _lift_bs(
+    kind: np.ndarray,
+    docs: np.ndarray,
+    words: np.ndarray,
+    counts: np.ndarray,
+    keep: np.ndarray,
+    bs: list[np.ndarray],
+) -> list[np.ndarray]:
+    """Lift a hierarchy over the kept vertices onto all vertices.
+
+    Each pruned word is assigned to the word group whose words co-occur with it
+    the most across documents, falling back to the largest word group.
+    """
+    n = len(kind)
+    bs = [np.asarray(b, dtype=np.int64) for b in bs]
+
+    bs0 = np.full(n, -1, dtype=np.int64)
+    bs0[keep] = bs[0]
+
+    kept_words = np.flatnonzero(keep & (kind == 1))
+    word_blocks, cols = np.unique(bs0[kept_words], return_inverse=True)
+    adj = sp.csr_matrix((counts, (words, docs)), shape=(n, n))
+    word_groups = sp.csr_matrix(
+        (np.ones(len(kept_words)), (kept_words, cols)),
+        shape=(n, len(word_blocks)),
+    )
+    doc_profiles = adj.T @ word_groups  # doc X word group token counts
+
+    pruned_words = np.flatnonzero(~keep)
+    scores = (adj[pruned_words] @ doc_profiles).tocsr()  # sparse word X word group
+    best = np.asarray(scores.argmax(axis=1)).ravel()
+    has_score = scores.max(axis=1).toarray().ravel() > 0
+    largest = np.bincount(cols).argmax()
+    bs0[pruned_words] = word_blocks[np.where(has_score, best, largest)]
+    return [bs0] + bs[1:]
+
+
+def _refine(fit: TieredFit, state, max_sweeps: int, epsilon: float):
+    for _ in range(max_sweeps):
+        dS, _, _ = state.multiflip_mcmc_sweep(beta=np.inf, niter=1)
+        if abs(dS) < epsilon:
+            break
+
+    source = fit.source
+    # published with a single assignment so readers never see a partial model.
+    fit.refined = _fitted_model(source, source.g, source.words, state)
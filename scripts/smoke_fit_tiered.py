@@ -0,0 +1,89 @@
+"""smoke_fit_tiered.py
+
+Smoke check for atap_wrapper.fit_tiered.
+Requires graph-tool and topsbm installed (see scripts/install_topsbm.sh).
+
+Usage (from anywhere):
+    python scripts/smoke_fit_tiered.py [corpus csv] [max_words] [max_doc_words]
+
+It checks that the provisional model, the refined model and the model updated by
+TieredFit.wait() all go through visualise() and add_results(), and prints the
+time taken by the provisional tier against a full sbmtm.fit().
+"""
+
+import os
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+import pandas as pd
+from atap_corpus import Corpus
+from topsbm.sbmtm import sbmtm
+
+import atap_wrapper as atap
+
+
+def check(model, corpus: Corpus, name: str):
+    for level in range(len(model.state.levels)):
+        p_td_d, p_tw_w = model.group_membership(l=level)
+        assert p_td_d.shape[1] == len(corpus), f"{name}: missing documents."
+        assert not np.isnan(p_td_d).any(), f"{name}: NaN document memberships."
+    for kind in ("documents", "words"):
+        atap.visualise(
+            model, corpus, kind=kind, width=500, height=500, hierarchy="tree"
+        )
+    print(f"{name}: OK ({len(model.state.levels)} levels, mdl={model.mdl:.1f})")
+
+
+def main(path: str, max_words: int, max_doc_words: int):
+    df = pd.read_csv(path)
+    os.chdir(REPO_DIR)  # visualise() reads ./viz relative to the repository.
+    corpus = Corpus.from_dataframe(df, col_doc="document", name="smoke")
+    new_corpus = lambda: Corpus.from_dataframe(df, col_doc="document", name="smoke")
+    list_of_words = [str(doc).lower().split() for doc in df["document"]]
+    titles = df["title"].tolist() if "title" in df.columns else None
+    atap.set_seed(42)
+
+    model = sbmtm()
+    model.make_graph(list_of_words, titles)
+    start = time.perf_counter()
+    fit = atap.fit_tiered(model, max_words=max_words, max_doc_words=max_doc_words)
+    provisional_secs = time.perf_counter() - start
+    print(f"provisional tier: {provisional_secs:.1f}s")
+
+    check(fit.provisional, corpus, "provisional")
+    atap.visualise(
+        fit, corpus, kind="documents", width=500, height=500, hierarchy="tree"
+    )
+    atap.add_results(fit, new_corpus())
+    print(f"add_results (provisional): {fit.snapshot()[1]}")
+
+    start = time.perf_counter()
+    fit.wait()
+    print(f"refinement (remaining): {time.perf_counter() - start:.1f}s")
+    check(fit.refined, corpus, "refined")
+    assert model.state is fit.refined.state, "wait() did not update the source model."
+    check(model, corpus, "source after wait()")
+    atap.add_results(fit, new_corpus())
+    atap.add_results(model, new_corpus())
+    print(f"description lengths: {fit.description_lengths()}")
+
+    full = sbmtm()
+    full.make_graph(list_of_words, titles)
+    start = time.perf_counter()
+    full.fit()
+    print(f"full sbmtm.fit(): {time.perf_counter() - start:.1f}s (mdl={full.mdl:.1f})")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        os.path.abspath(args[0])
+        if len(args) > 0
+        else os.path.join(REPO_DIR, "corpus_files/corpus.csv"),
+        int(args[1]) if len(args) > 1 else 200,
+        int(args[2]) if len(args) > 2 else 10,
+    )